@@ -1,12 +1,17 @@
 class TracksController < ApplicationController
   include TracksHelper
-  require 'googleauth'
-  require "google/cloud/language"
+
+  #MusicGraph genres offered in the genre madlib
+  GENRES = ["Alternative/Indie", "Blues", "Cast Recordings/Cabaret", "Christian/Gospel", "Children's",
+            "Classical/Opera", "Comedy/Spoken Word", "Country", "Electronica/Dance", "Folk",
+            "Jazz", "Latin", "New Age", "Pop", "Rap/Hip Hop", "Reggae/Ska", "Rock", "Seasonal", "Soul/R&B",
+            "Soundtracks", "Vocals", "World"].freeze
+
+  #Guards the shared Language client, which puma threads may ask for at once
+  LANGUAGE_LOCK = Mutex.new
+
   def index
-    @genres = ["Alternative/Indie", "Blues", "Cast Recordings/Cabaret", "Christian/Gospel", "Children's",
-              "Classical/Opera", "Comedy/Spoken Word", "Country", "Electronica/Dance", "Folk",
-              "Jazz", "Latin", "New Age", "Pop", "Rap/Hip Hop", "Reggae/Ska", "Rock", "Seasonal", "Soul/R&B",
-              "Soundtracks", "Vocals", "World"]
+    @genres = GENRES
   end
 
 #Search just by keyword(s)
@@ -24,7 +29,7 @@ class TracksController < ApplicationController
     respond_to do |format|
       if @tracks.length > 0
         format.html {render :show, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+        format.json {render json: @tracks.map(&:to_search_json)}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -42,11 +47,11 @@ class TracksController < ApplicationController
     cookies[:feeling] = params[:feeling]
 
     @form_feeling = params[:feeling]
-    @tracks = TracksHelper::Track.lyrics_keywords(params[:word], 20).select{ |t| t.match_sentiment(@form_feeling)}
+    @tracks = TracksHelper::Track.lyrics_keywords(params[:word], 20) { |t| t.match_sentiment(@form_feeling) }
     respond_to do |format|
       if @tracks.length > 0
         format.html {render :show, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+        format.json {render json: @tracks.map(&:to_search_json)}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -66,58 +71,47 @@ class TracksController < ApplicationController
 
 
     # feelings_day(params[:feeling], params[:day])
-    # require 'googleauth'
-    # Get the environment configured authorization
-    scopes =  ['https://www.googleapis.com/auth/cloud-platform',
-               'https://www.googleapis.com/auth/compute']
-    authorization = Google::Auth.get_application_default(scopes)
-
-    # Add the the access token obtained using the authorization to a hash, e.g
-    # headers.
-    some_headers = {}
-    authorization.apply(some_headers)
-
     @day_feeling = params[:day]
     @tracks = TracksHelper::Track.lyrics_keywords(params[:feeling], 20)
 
-    # require "google/cloud/language"
-    language = Google::Cloud::Language.new
-    content = @day_feeling
-    document = language.document content
-    annotation = document.annotate
-
 
     respond_to do |format|
       if @tracks.length > 0
+        #Only ask Google for the day's sentiment once there are tracks to match it against
+        content = @day_feeling
+        document = language.document content
+        annotation = document.annotate
+        score = annotation.sentiment.score
+
         @songs = []
         @tracks.each do |track|
           if track.track_spotify_id != nil
-            song = RSpotify::AudioFeatures.find(track.track_spotify_id)
-            if song.valence < 0.2 && annotation.sentiment.score < -(0.4)
+            song = track.audio_features
+            if song.valence < 0.2 && score < -(0.4)
               @songs << track
-            elsif (song.valence > 0.2 && song.valence < 0.4) && (annotation.sentiment.score < 0 && annotation.sentiment.score > -(0.4))
+            elsif (song.valence > 0.2 && song.valence < 0.4) && (score < 0 && score > -(0.4))
               @songs << track
-            elsif (song.valence > 0.4 && song.valence < 0.6) && (annotation.sentiment.score < 0.5 && annotation.sentiment.score > 0)
+            elsif (song.valence > 0.4 && song.valence < 0.6) && (score < 0.5 && score > 0)
               @songs << track
-            elsif (song.valence > 0.6 && song.valence <= 1) && (annotation.sentiment.score > 0.5 && annotation.sentiment.score <= 1)
+            elsif (song.valence > 0.6 && song.valence <= 1) && (score > 0.5 && score <= 1)
               @songs << track
             end
 
           else
-            if annotation.sentiment.score < -(0.4)
+            if score < -(0.4)
               @songs << track
-            elsif annotation.sentiment.score < 0 && annotation.sentiment.score > -(0.4)
+            elsif score < 0 && score > -(0.4)
               @songs << track
-            elsif annotation.sentiment.score < 0.5 && annotation.sentiment.score > 0
+            elsif score < 0.5 && score > 0
               @songs << track
-            elsif annotation.sentiment.score <= 1 && annotation.sentiment.score > 0.5
+            elsif score <= 1 && score > 0.5
               @songs << track
             end
           end
 
         end
         format.html {render :show, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+        format.json {render json: @tracks.map(&:to_search_json)}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -135,12 +129,12 @@ class TracksController < ApplicationController
     cookies[:weather] = params[:want_to]
     cookies[:search] = params[:weather]
 
-    @tracks = TracksHelper::Track.lyrics_keywords(params[:weather], 30).select{ |t| t.match_weather(params[:want_to])}
+    @tracks = TracksHelper::Track.lyrics_keywords(params[:weather], 30) { |t| t.match_weather(params[:want_to]) }
 
     respond_to do |format|
       if @tracks.length > 0
         format.html {render :show, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+        format.json {render json: @tracks.map(&:to_search_json)}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -159,11 +153,11 @@ def search_with_age
   cookies[:search] = params[:age]
 
   @form_feeling = params[:feeling]
-  @tracks = TracksHelper::Track.lyrics_keywords(params[:age], 20).select{ |t| t.match_sentiment(@form_feeling)}
+  @tracks = TracksHelper::Track.lyrics_keywords(params[:age], 20) { |t| t.match_sentiment(@form_feeling) }
   respond_to do |format|
     if @tracks.length > 0
       format.html {render :show, layout: false}
-      format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+      format.json {render json: @tracks.map(&:to_search_json)}
     else
       flash[:danger] = 'There was a problem'
       format.html { render :_no_results, layout: false }
@@ -180,11 +174,11 @@ end
     cookies[:search] = params[:word]
     cookies[:party] = true
 
-    @tracks = TracksHelper::Track.lyrics_keywords(params[:word], 30).select{|t| (t.audio_features.valence > 0.6)==true && (t.audio_features.danceability > 0.6)==true}
+    @tracks = TracksHelper::Track.lyrics_keywords(params[:word], 30) { |t| (t.audio_features.valence > 0.6)==true && (t.audio_features.danceability > 0.6)==true }
     respond_to do |format|
       if @tracks.length > 0
         format.html {render :show, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+        format.json {render json: @tracks.map(&:to_search_json)}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -201,11 +195,11 @@ end
     cookies[:search] = params[:word]
     cookies[:dance] = true
 
-    @tracks = TracksHelper::Track.lyrics_keywords(params[:word], 30).select{|t| (t.audio_features.tempo > 0.6)==true && (t.audio_features.danceability > 0.6)==true}
+    @tracks = TracksHelper::Track.lyrics_keywords(params[:word], 30) { |t| (t.audio_features.tempo > 0.6)==true && (t.audio_features.danceability > 0.6)==true }
     respond_to do |format|
       if @tracks.length > 0
         format.html {render :show, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+        format.json {render json: @tracks.map(&:to_search_json)}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -221,14 +215,13 @@ end
     cookies[:feeling] = ""
     cookies[:genre] = params[:genre]
     cookies[:search] = params[:word]
-    p "In search w genre" + cookies[:genre]
 
 
     @tracks = TracksHelper::Track.lyrics_keywords(params[:word], 20, params[:genre])
       respond_to do |format|
         if @tracks.length > 0
           format.html {render :show, layout: false}
-          format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+          format.json {render json: @tracks.map(&:to_search_json)}
         else
           flash[:danger] = 'There was a problem'
           format.html { render :_no_results, layout: false }
@@ -238,17 +231,16 @@ end
   end
 
   def see_more
-    p "In see more" + cookies[:genre]
     if cookies[:weather] != ""
-      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 30, "", 30).select{ |t| t.match_weather(cookies[:weather])}
+      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 30, "", 30) { |t| t.match_weather(cookies[:weather]) }
     elsif cookies[:genre] != ""
       @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 20, cookies[:genre], 20)
     elsif cookies[:party]
-      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 30, "", 30).select{|t| (t.audio_features.valence > 0.6)==true && (t.audio_features.danceability > 0.6)==true}
+      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 30, "", 30) { |t| (t.audio_features.valence > 0.6)==true && (t.audio_features.danceability > 0.6)==true }
     elsif cookies[:dance]
-      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 30, "", 30).select{|t| (t.audio_features.tempo > 0.6)==true && (t.audio_features.danceability > 0.6)==true}
+      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 30, "", 30) { |t| (t.audio_features.tempo > 0.6)==true && (t.audio_features.danceability > 0.6)==true }
     elsif cookies[:feeling] != ""
-      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 20, "", 20).select{ |t| t.match_sentiment(cookies[:feeling])}
+      @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 20, "", 20) { |t| t.match_sentiment(cookies[:feeling]) }
     else
       @tracks = TracksHelper::Track.lyrics_keywords(cookies[:search], 20, "", 20)
     end
@@ -256,7 +248,7 @@ end
     respond_to do |format|
       if @tracks.length > 0
         format.html {render :_more_results, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_youtube_id")}}
+        format.json {render json: @tracks.map(&:to_search_json)}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -267,15 +259,11 @@ end
   end
 
   def random_search
-    language = Google::Cloud::Language.new
-
     content = params[:text]
-    p content
     document = language.document content
     annotation = document.annotate
 
     score = annotation.sentiment.score
-    p score
 
     if score <= -(0.4)
        word = "depressing"
@@ -287,13 +275,12 @@ end
        word = "happy"
     end
 
-    p word
     @tracks = TracksHelper::Track.lyrics_keywords(word, 20)
 
     respond_to do |format|
       if @tracks.length > 0
         format.html {render :show, layout: false}
-        format.json {render json: @tracks.map{|track| track.as_json.slice("title", "artist_name", "track_spotify_id")}}
+        format.json {render json: @tracks.map{|track| track.to_search_json(TracksHelper::Track::SPOTIFY_SEARCH_JSON_FIELDS)}}
       else
         flash[:danger] = 'There was a problem'
         format.html { render :_no_results, layout: false }
@@ -301,4 +288,21 @@ end
       end
     end
   end
+
+  #Building a Language client resolves credentials and opens a gRPC channel,
+  #so create it once per process and share it across requests
+  def self.language
+    LANGUAGE_LOCK.synchronize do
+      @language ||= begin
+        require "google/cloud/language"
+        Google::Cloud::Language.new
+      end
+    end
+  end
+
+  private
+
+  def language
+    self.class.language
+  end
 end
@@ -14,12 +14,17 @@ module TracksHelper
       #tracks =[#<TracksHelper::Track:0x007fcb9df03cd0 @release_year=2012, @track_spotify_id="55h7vJchibLdUkxdlX3fK7", @popularity="0.871385", @title="Treasure", @artist_name="Bruno Mars", @duration=179>,...]
 
   class Track
-    attr_reader :release_year, :title, :track_spotify_id, :popularity, :artist_name, :album_title, :lyrics, :genre, :track_youtube_id, :audio_features
+    attr_reader :release_year, :title, :track_spotify_id, :popularity, :artist_name, :album_title, :genre, :track_youtube_id, :audio_features
 
 
     API_URL = "http://api.musicgraph.com/api/v2/track/"
+    SEARCH_URL = "#{API_URL}search"
+    SEARCH_JSON_FIELDS = ["title", "artist_name", "track_youtube_id"].freeze
+    SPOTIFY_SEARCH_JSON_FIELDS = ["title", "artist_name", "track_spotify_id"].freeze
+    #Guards the shared Lyricfy fetcher, which the lyrics pool threads ask for at once
+    LYRICS_FETCHER_LOCK = Mutex.new
 
-    def initialize(attributes)
+    def initialize(attributes, audio_features = nil)
       #[MusicGraph] these attributes from MusicGraph
       @release_year = attributes["release_year"]
       @track_spotify_id = attributes["track_spotify_id"]
@@ -27,30 +32,18 @@ module TracksHelper
       @title = attributes["title"]
       @artist_name = attributes["artist_name"]
       @duration = attributes["duration"]
-      @genre = attributes["main_genre"]
+      @genre = attributes["main_genre"] || "no genre found"
       @track_youtube_id = attributes['track_youtube_id']
 
-      if attributes["main_genre"] == nil
-        @genre = "no genre found"
-      end
-
-      @audio_features = RSpotify::AudioFeatures.find(attributes["track_spotify_id"])
-      #audio_features include :valence, :danceability, :duration_ms, :energy, :instrumentalness, :liveness, :speechiness, :tempo, :time_signature, :mode
-
-      #[Lyricfy] Get lyrics, set to nil if error
-      begin
-        @lyrics = get_lyrics(format_for_lyrics_wikia(attributes["title"], attributes["artist_name"]))
-      rescue ArgumentError => e
-        @lyrics = "Lyrics not found"
-      end
-
-      #[RSpotify] Get audio_features for track
+      #[RSpotify] Get audio_features for track, unless they were passed in from the bulk lookup
         #audio_features include :valence, :danceability, :duration_ms, :energy, :instrumentalness, :liveness, :speechiness, :tempo, :time_signature, :mode
-      @audio_features = RSpotify::AudioFeatures.find(attributes["track_spotify_id"])
+      @audio_features = audio_features || RSpotify::AudioFeatures.find(attributes["track_spotify_id"])
     end
 
     #Find tracks by a given keyword, initialize new tracks with attrs
-    def self.lyrics_keywords(params, limit=12, genre="", offset="") #TD: RENAME - self.get_tracks_by_keyword
+      #An optional block filters the tracks before their lyrics are fetched:
+      #tracks = TracksHelper::Track.lyrics_keywords(params[:word], 20) { |t| t.match_sentiment("happy") }
+    def self.lyrics_keywords(params, limit=12, genre="", offset="", &filter) #TD: RENAME - self.get_tracks_by_keyword
       sanitized_string = params.gsub("'","")
 
       # if genre, get and sanitize
@@ -63,13 +56,64 @@ module TracksHelper
       end
 
       if params.is_a? String
-        response = Faraday.get("#{API_URL}search?api_key=#{ENV['MUSIC_GRAPH_API_KEY']}&limit=#{limit}&lyrics_keywords=#{sanitized_string}" + "#{genre_url}" + "#{offset_url}")
+        response = Faraday.get("#{SEARCH_URL}?api_key=#{ENV['MUSIC_GRAPH_API_KEY']}&limit=#{limit}&lyrics_keywords=#{sanitized_string}#{genre_url}#{offset_url}")
 
       end
       tracks = JSON.parse(response.body)["data"]
       clean_tracks = clean_and_prepare_track_data(tracks)
+      return [] if clean_tracks.empty?
       # byebug
-      clean_tracks.map { |attributes| Track.new(attributes) }
+      #[RSpotify] One request for the audio_features of every track instead of one per track
+      audio_features = RSpotify::AudioFeatures.find(clean_tracks.map { |attributes| attributes["track_spotify_id"] })
+
+      #Spotify returns nil for ids it has no features for, asking again per id would only fail,
+        #so those tracks are skipped
+      tracks = clean_tracks.zip(audio_features).reject { |attributes, features| features.nil? }
+      tracks = tracks.map { |attributes, features| Track.new(attributes, features) }
+      tracks = tracks.select(&filter) if filter
+
+      #Only scrape lyrics for the tracks we keep, in parallel on the lyrics pool
+      futures = tracks.map do |track|
+        Concurrent::Future.execute(executor: ::LYRICS_POOL) do
+          Rails.application.executor.wrap { track.lyrics }
+        end
+      end
+
+      #Wait for every scrape before raising the first failure, so none outlive the request
+      ActiveSupport::Dependencies.interlock.permit_concurrent_loads { futures.each(&:wait) }
+      failed = futures.find(&:rejected?)
+      raise failed.reason if failed
+      tracks
+    end
+
+    #[Lyricfy] Get lyrics on first use, "Lyrics not found" if error
+      #found lyrics are cached per song, since See More and repeat searches keep hitting the same tracks
+      #misses are not cached, so the next request tries the scrape again
+    def lyrics
+      @lyrics ||= begin
+        cache_key = ["lyrics", artist_name, title]
+        found = Rails.cache.read(cache_key)
+        unless found
+          found = get_lyrics(format_for_lyrics_wikia(title, artist_name)).presence
+          Rails.cache.write(cache_key, found, expires_in: 1.day) if found
+        end
+        found || "Lyrics not found"
+      rescue ArgumentError => e
+        "Lyrics not found"
+      end
+    end
+
+    #Build the JSON for a search result straight from the readers, instead of
+    #serializing every instance variable (lyrics, audio_features) and slicing
+    def to_search_json(fields = SEARCH_JSON_FIELDS)
+      fields.each_with_object({}) { |field, json| json[field] = public_send(field) }
+    end
+
+    #A Lyricfy fetcher keeps no per-search state, so every track shares one
+    def self.lyrics_fetcher
+      LYRICS_FETCHER_LOCK.synchronize do
+        @lyrics_fetcher ||= Lyricfy::Fetcher.new
+      end
     end
 
     #Only display tracks that have valid spotify id's
@@ -145,25 +189,21 @@ module TracksHelper
         return {title:title, artist_name: artist_name}
     end
 
-      #[Lyricfy] Lyricfy gets lyrics from LyricsWikia or MetroMix
+      #[Lyricfy] Lyricfy gets lyrics from LyricsWikia or MetroMix, nil if not found
       def get_lyrics(args)
         begin
-          fetcher = Lyricfy::Fetcher.new
-          p x = args[:artist_name]
-          p y = args[:title]
+          fetcher = Track.lyrics_fetcher
+          x = args[:artist_name]
+          y = args[:title]
           song = fetcher.search(x, y) if fetcher
         rescue NoMethodError => e
-          return "Lyric not found"
+          return nil
         end
 
         begin
-          if song
-            song.body("\n")
-          else
-            return "Lyrics not found"
-          end
+          song.body("\n") if song
         rescue NoMethodError => e
-          return "Lyrics not found"
+          return nil
         end
       end
 
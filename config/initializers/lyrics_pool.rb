@@ -0,0 +1,4 @@
+#Bounded pool shared by all requests for scraping lyrics in TracksHelper::Track.lyrics_keywords.
+#Built here, outside the reloadable app code, so development reloads don't leak a pool each time.
+LYRICS_POOL = Concurrent::FixedThreadPool.new(5)
+at_exit { LYRICS_POOL.shutdown }
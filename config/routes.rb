@@ -20,10 +20,4 @@ Rails.application.routes.draw do
 
   get "/see_more", to: "tracks#see_more"
 
-
-
-
-  resources :demos, only: [:index, :searchstuff, :show]
-  get '/searchstuff', to: 'demos#search'
-
 end
@@ -0,0 +1,81 @@
+require 'test_helper'
+
+class TracksHelperTest < ActiveSupport::TestCase
+  Response = Struct.new(:body)
+  Features = Struct.new(:id, :valence)
+
+  #Stands in for Lyricfy::Fetcher and records every song it is asked for
+  class RecordingFetcher
+    attr_reader :searched
+
+    def initialize
+      @searched = Concurrent::Array.new
+    end
+
+    def search(artist_name, title)
+      @searched << title
+      nil
+    end
+  end
+
+  def music_graph_response(*ids)
+    tracks = ids.map { |id| { "title" => "Song #{id}", "artist_name" => "Artist #{id}", "track_spotify_id" => id } }
+    Response.new({ "data" => tracks }.to_json)
+  end
+
+  test "lyrics_keywords pairs each track with its own audio features" do
+    features = [Features.new("a", 0.1), Features.new("b", 0.9)]
+
+    Faraday.stub :get, music_graph_response("a", "b") do
+      RSpotify::AudioFeatures.stub :find, features do
+        TracksHelper::Track.stub :lyrics_fetcher, RecordingFetcher.new do
+          tracks = TracksHelper::Track.lyrics_keywords("love")
+
+          assert_equal ["a", "b"], tracks.map(&:track_spotify_id)
+          assert_equal ["a", "b"], tracks.map { |track| track.audio_features.id }
+        end
+      end
+    end
+  end
+
+  test "lyrics_keywords only fetches lyrics for tracks kept by the filter" do
+    features = [Features.new("c", 0.1), Features.new("d", 0.9)]
+    fetcher = RecordingFetcher.new
+
+    Faraday.stub :get, music_graph_response("c", "d") do
+      RSpotify::AudioFeatures.stub :find, features do
+        TracksHelper::Track.stub :lyrics_fetcher, fetcher do
+          tracks = TracksHelper::Track.lyrics_keywords("love") { |t| t.audio_features.valence > 0.5 }
+
+          assert_equal ["d"], tracks.map(&:track_spotify_id)
+          assert_equal ["Song_d"], fetcher.searched
+        end
+      end
+    end
+  end
+
+  test "lyrics_keywords skips tracks Spotify has no audio features for" do
+    lookups = []
+    find = ->(ids) { lookups << ids; [Features.new("e", 0.1), nil, Features.new("g", 0.9)] }
+
+    Faraday.stub :get, music_graph_response("e", "f", "g") do
+      RSpotify::AudioFeatures.stub :find, find do
+        TracksHelper::Track.stub :lyrics_fetcher, RecordingFetcher.new do
+          tracks = TracksHelper::Track.lyrics_keywords("love")
+
+          assert_equal ["e", "g"], tracks.map(&:track_spotify_id)
+          assert_equal ["e", "g"], tracks.map { |track| track.audio_features.id }
+          assert_equal [["e", "f", "g"]], lookups
+        end
+      end
+    end
+  end
+
+  test "lyrics_keywords returns no tracks when MusicGraph finds nothing" do
+    Faraday.stub :get, Response.new({ "data" => [] }.to_json) do
+      RSpotify::AudioFeatures.stub :find, ->(ids) { flunk "audio features fetched for #{ids}" } do
+        assert_equal [], TracksHelper::Track.lyrics_keywords("love")
+      end
+    end
+  end
+end